@@ -1,15 +1,23 @@
 import requests
+import json
 import os
 import time
 import re
 import unicodedata 
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # --- CONFIGURATION ---
 ORCID_ID = "0000-0002-7385-4723"
 ASSETS_DIR = "assets"
 BIB_SUBDIR = os.path.join(ASSETS_DIR, "bib")
 BIB_FILE = os.path.join(ASSETS_DIR, "references.bib")
+# ETag / Last-Modified of the ORCID works list that BIB_FILE was built from
+CACHE_META_FILE = os.path.join(ASSETS_DIR, "references.json")
+ORCID_WORKS_URL = f"https://pub.orcid.org/v3.0/{ORCID_ID}/works"
 CACHE_DURATION_HOURS = 24
+MAX_WORKERS = 8
 
 # Headers
 orcid_headers = {"Accept": "application/vnd.orcid+json"}
@@ -50,40 +58,166 @@ LATEX_MAP = {
     'â€': r"---",   # Corresponds to a partial em-dash or other symbol
 }
 
+# Single characters are replaced in one pass with str.translate; the few
+# multi-character sequences (corrupted strings, ampersands) are handled separately.
+_SINGLE_CHAR_TABLE = str.maketrans({k: v for k, v in LATEX_MAP.items() if len(k) == 1})
+_MULTI_CHAR_MAP = {k: v for k, v in LATEX_MAP.items() if len(k) > 1}
+# Longest keys first so that 'â€“' wins over its prefix 'â€'
+_MULTI_CHAR_RE = re.compile(
+    "|".join(re.escape(k) for k in sorted(_MULTI_CHAR_MAP, key=len, reverse=True))
+)
+
+# Maps every ASCII character outside [a-zA-Z0-9-_] to '_' for slugify
+_SLUG_SAFE = set(b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_")
+_SLUG_TABLE = {c: c if c in _SLUG_SAFE else ord('_') for c in range(128)}
+
 def ensure_directories():
     if not os.path.exists(BIB_SUBDIR):
         os.makedirs(BIB_SUBDIR)
 
-def is_cache_valid():
-    if not os.path.exists(BIB_FILE):
+def is_fresh(path):
+    if not os.path.exists(path):
         return False
-    file_mod_time = os.path.getmtime(BIB_FILE)
-    if (time.time() - file_mod_time) < (CACHE_DURATION_HOURS * 3600):
-        return True
-    return False
+    file_mod_time = os.path.getmtime(path)
+    return (time.time() - file_mod_time) < (CACHE_DURATION_HOURS * 3600)
+
+def load_cache_meta():
+    if not os.path.exists(CACHE_META_FILE):
+        return {}
+    try:
+        with open(CACHE_META_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache_meta(orcid_response, incomplete=False):
+    # An incomplete BIB_FILE (some DOIs failed) stores no validators, so the
+    # time-based check decides and failed DOIs are retried once it expires
+    if incomplete:
+        meta = {"incomplete": True}
+    else:
+        meta = {
+            "etag": orcid_response.headers.get("ETag"),
+            "last_modified": orcid_response.headers.get("Last-Modified"),
+        }
+    with open(CACHE_META_FILE, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+def check_cache(session):
+    """
+    Asks ORCID whether the works list changed since BIB_FILE was built.
+    Falls back to the time-based check if no validators were saved or the
+    last build was incomplete.
+
+    Returns (cache_hit, orcid_response), where orcid_response is the full
+    works response when ORCID already sent it (200), so it is not fetched twice.
+    """
+    if not os.path.exists(BIB_FILE):
+        return False, None
+
+    meta = load_cache_meta()
+    if meta.get("incomplete"):
+        return is_fresh(BIB_FILE), None
+    headers = dict(orcid_headers)
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    if len(headers) == len(orcid_headers):
+        return is_fresh(BIB_FILE), None
+
+    try:
+        response = session.get(ORCID_WORKS_URL, headers=headers)
+    except requests.RequestException as e:
+        # Offline: keep the existing file rather than failing the build
+        print(f"Could not reach ORCID ({e}), keeping {BIB_FILE}.")
+        return True, None
+    if response.status_code == 200:
+        return False, response
+    return response.status_code == 304, None
 
 def slugify(text):
     """
     Create a safe filename from a DOI. 
     """
-    return re.sub(r'[^a-zA-Z0-9-_]', '_', text)
+    # Non-ASCII characters become '?' first, which the table then maps to '_'
+    return text.encode('ascii', 'replace').decode('ascii').translate(_SLUG_TABLE)
+
+def individual_bib_path(doi):
+    return os.path.join(BIB_SUBDIR, f"{slugify(doi)}.bib")
 
 def cleanup_bibtex_entry(bib_text):
     """Applies generic character cleanup using LaTeX escape sequences."""
-    # 1. Normalize the text
-    safe_text = unicodedata.normalize('NFKC', bib_text)
+    # 1. Normalize the text (the check is cheap and avoids a copy when already normalized)
+    safe_text = bib_text
+    if not unicodedata.is_normalized('NFKC', safe_text):
+        safe_text = unicodedata.normalize('NFKC', safe_text)
 
-    # 2. Apply LaTeX mapping to all characters
-    for utf_char, latex_escape in LATEX_MAP.items():
-        safe_text = safe_text.replace(utf_char, latex_escape)
-        
-    return safe_text
+    # 2. Replace the corrupted multi-character sequences in a single scan, before their
+    #    individual characters (e.g. 'Ã', '“') are rewritten by the table below
+    safe_text = _MULTI_CHAR_RE.sub(lambda m: _MULTI_CHAR_MAP[m.group(0)], safe_text)
+
+    # 3. Apply LaTeX mapping to all single characters in one pass
+    return safe_text.translate(_SINGLE_CHAR_TABLE)
+
+
+def create_session():
+    """Shared session so connections to doi.org are kept alive across requests."""
+    session = requests.Session()
+    session.headers.update(doi_headers)
+    adapter = HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=16,
+        # Also retry throttling and server errors, honouring Retry-After
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+        ),
+    )
+    session.mount("https://", adapter)
+    return session
+
+def fetch_one(session, pub):
+    """
+    Downloads and cleans the BibTeX entry for a single publication.
+
+    Returns the entry and the individual file it still has to be written to,
+    or None as path when it was read from a fresh cached file.
+    """
+    doi = pub["doi"]
+    individual_path = individual_bib_path(doi)
+
+    # Reuse the individual file if it was downloaded recently
+    if is_fresh(individual_path):
+        with open(individual_path, "r", encoding="utf-8") as f:
+            return f.read(), None
+
+    bib_response = session.get(f"https://doi.org/{doi}")
+    bib_response.raise_for_status()
+
+    # Decode the raw bytes ourselves: response.text never raises on bad
+    # UTF-8, it silently inserts replacement characters. Prefer UTF-8, then
+    # Windows-1252 (the usual legacy encoding), and Latin-1 as the last resort
+    # for the few bytes cp1252 leaves undefined.
+    raw = bib_response.content
+    try:
+        raw_bib_text = raw.decode('utf-8').strip()
+    except UnicodeDecodeError:
+        try:
+            raw_bib_text = raw.decode('cp1252').strip()
+        except UnicodeDecodeError:
+            raw_bib_text = raw.decode('iso-8859-1').strip()
+
+    return cleanup_bibtex_entry(raw_bib_text), individual_path
 
 
 def main():
     ensure_directories()
+    session = create_session()
 
-    if is_cache_valid():
+    cache_hit, orcid_response = check_cache(session)
+    if cache_hit:
         print(f"CACHE HIT: {BIB_FILE} is valid. Skipping download.")
         return
 
@@ -92,7 +226,8 @@ def main():
 
     try:
         # 1. Fetch works (omitted for brevity)
-        orcid_response = requests.get(f"https://pub.orcid.org/v3.0/{ORCID_ID}/works", headers=orcid_headers)
+        if orcid_response is None:
+            orcid_response = session.get(ORCID_WORKS_URL, headers=orcid_headers)
         orcid_response.raise_for_status()
         works_data = orcid_response.json()
         works = works_data.get("group", [])
@@ -118,44 +253,55 @@ def main():
         # 3. Sort (omitted for brevity)
         publications_to_process.sort(key=lambda x: x.get("year") or 0, reverse=True)
 
-        # 4. Download BibTeX
-        final_bib_entries = []
+        # 4. Download BibTeX and save master file (in parallel, entries kept in sorted order)
+        written = 0
+        failed = 0
         print(f"Downloading BibTeX for {len(publications_to_process)} publications...")
-        
-        for pub in publications_to_process:
-            doi = pub["doi"]
-            try:
-                bib_response = requests.get(f"https://doi.org/{doi}", headers=doi_headers)
-                bib_response.raise_for_status()
-                
-                # Force requests to re-evaluate text using ISO-8859-1 (Latin-1) 
-                # if standard UTF-8 fails. This often resolves misencoded strings
-                # before cleanup. We prioritize UTF-8 detection but fall back.
-                try:
-                    bib_response.encoding = 'utf-8'
-                    raw_bib_text = bib_response.text.strip()
-                except UnicodeDecodeError:
-                    bib_response.encoding = 'iso-8859-1'
-                    raw_bib_text = bib_response.text.strip()
-                    
-                bib_text = cleanup_bibtex_entry(raw_bib_text)
-                
-                # Save individual file using slugified DOI
-                slug = slugify(doi)
-                individual_path = os.path.join(BIB_SUBDIR, f"{slug}.bib")
-                with open(individual_path, "w", encoding="utf-8") as f:
-                    f.write(bib_text)
-                
-                final_bib_entries.append(bib_text)
-                time.sleep(0.2)
-            except Exception as e:
-                print(f"  Failed {doi}: {e}")
-
-        # 5. Save master file
-        with open(BIB_FILE, "w", encoding="utf-8") as f:
-            f.write("\n\n".join(final_bib_entries))
+
+        # Entries are appended as they arrive, so nothing is held in memory and
+        # each new entry goes straight to both the master and its individual file.
+        # The master is streamed into a temporary file and only replaces BIB_FILE
+        # once complete, so an interrupted run keeps the previous bibliography.
+        tmp_bib_file = f"{BIB_FILE}.tmp"
+        try:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, \
+                    open(tmp_bib_file, "w", encoding="utf-8", buffering=1 << 16) as master:
+                futures = [
+                    (pub["doi"], executor.submit(fetch_one, session, pub))
+                    for pub in publications_to_process
+                ]
+                # Files are written here while the workers keep downloading
+                for doi, future in futures:
+                    try:
+                        bib_text, individual_path = future.result()
+                        if individual_path:
+                            with open(individual_path, "w", encoding="utf-8") as f:
+                                f.write(bib_text)
+                    except Exception as e:
+                        failed += 1
+                        # Keep the publication listed with its stale individual file
+                        stale_path = individual_bib_path(doi)
+                        if not os.path.exists(stale_path):
+                            print(f"  Failed {doi}: {e}")
+                            continue
+                        print(f"  Failed {doi}: {e} (using stale {stale_path})")
+                        with open(stale_path, "r", encoding="utf-8") as f:
+                            bib_text = f.read()
+                    if written:
+                        master.write("\n\n")
+                    master.write(bib_text)
+                    written += 1
+            os.replace(tmp_bib_file, BIB_FILE)
+        finally:
+            if os.path.exists(tmp_bib_file):
+                os.remove(tmp_bib_file)
+
         print(f"Done! Saved to {BIB_FILE}")
 
+        # Only trust the validators if the file is complete, so failed
+        # DOIs are retried once the cache duration has passed
+        save_cache_meta(orcid_response, incomplete=bool(failed))
+
     except Exception as e:
         print(f"Error: {e}")
         # Ensure file exists to prevent build errors
@@ -1,11 +1,22 @@
+import glob
+import io
 import os
 import re
 import shutil
 
 # --- CONFIGURATION ---
+# Splits HTML into alternating text and tag tokens (tags at odd indices).
+# Quoted attribute values may contain '>' without ending the tag.
+_TOKEN_RE = re.compile(r'''(<(?:"[^"]*"|'[^']*'|[^'">])*>)''')
+_SLUG_RE = re.compile(r'[^a-zA-Z0-9-_]')
+_ENTRY_RE = re.compile(
+    r'(<div[^>]*class="[^"]*\bcsl-entry\b[^"]*"[^>]*>)(.*?)(</div>)', 
+    re.DOTALL | re.IGNORECASE
+)
+
 def slugify(text):
     # slugify is no longer used but kept for completeness
-    return re.sub(r'[^a-zA-Z0-9-_]', '_', text)
+    return _SLUG_RE.sub('_', text)
 
 def find_output_file():
     # Check standard Quarto output directory (_site) first
@@ -37,22 +48,33 @@ def copy_bib_assets(output_html_path):
         os.makedirs(dest_dir)
 
     count = 0
-    for filename in os.listdir(src_dir):
-        if filename.endswith(".bib"):
-            s = os.path.join(src_dir, filename)
-            d = os.path.join(dest_dir, filename)
+    for s in glob.iglob(os.path.join(src_dir, "*.bib")):
+        d = os.path.join(dest_dir, os.path.basename(s))
+
+        # Skip files that are already up to date (or hard links to the source)
+        if os.path.exists(d):
+            src_stat = os.stat(s)
+            dest_stat = os.stat(d)
+            if (src_stat.st_size == dest_stat.st_size
+                    and src_stat.st_mtime_ns == dest_stat.st_mtime_ns):
+                continue
+            os.remove(d)
+
+        # Hard link when on the same filesystem, otherwise copy
+        try:
+            os.link(s, d)
+        except OSError:
             shutil.copy2(s, d)
-            count += 1
+        count += 1
             
     if count > 0:
         print(f"Post-process: Copied {count} .bib files to {dest_dir}")
 
 def process_content(content):
-    entry_pattern = re.compile(
-        r'(<div[^>]*class="[^"]*\bcsl-entry\b[^"]*"[^>]*>)(.*?)(</div>)', 
-        re.DOTALL | re.IGNORECASE
-    )
-    
+    # Nothing to bold, skip the regex scan over the whole page
+    if 'Maus' not in content:
+        return content
+
     def modify_entry(entry_match):
         div_start = entry_match.group(1)
         entry_content = entry_match.group(2)
@@ -60,14 +82,26 @@ def process_content(content):
         
         # --- STEP 1: Bold Author Name ---
         # This remains, as it's the only remaining modification.
-        entry_content = re.sub(r'Maus(?![^<]*>)', '<strong>Maus</strong>', entry_content)
+        # Only text tokens are touched, never attributes inside tags. A raw
+        # '>' in the text (e.g. "Maus > x") does not suppress bolding.
+        parts = _TOKEN_RE.split(entry_content)
+        for i in range(0, len(parts), 2):
+            parts[i] = parts[i].replace('Maus', '<strong>Maus</strong>')
+        entry_content = ''.join(parts)
 
         # --- STEP 2: The link insertion logic is removed entirely ---
         
         return f"{div_start}{entry_content}{div_end}"
 
-    new_content = entry_pattern.sub(modify_entry, content)
-    return new_content
+    # Copy the text between entries and the modified entries into one buffer
+    buf = io.StringIO()
+    last = 0
+    for entry_match in _ENTRY_RE.finditer(content):
+        buf.write(content[last:entry_match.start()])
+        buf.write(modify_entry(entry_match))
+        last = entry_match.end()
+    buf.write(content[last:])
+    return buf.getvalue()
 
 def main():
     file_path = find_output_file()